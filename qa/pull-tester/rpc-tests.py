@@ -191,6 +191,8 @@ def main():
     enable_utils = config["components"].getboolean("ENABLE_UTILS")
     enable_bitcoind = config["components"].getboolean("ENABLE_BITCOIND")
     enable_zmq = config["components"].getboolean("ENABLE_ZMQ") and not args.nozmq
+    # Lets tests use ZMQ notifications where kotod supports them
+    os.environ["ENABLE_ZMQ"] = "1" if enable_zmq else "0"
 
     if config["environment"]["EXEEXT"] == ".exe" and not args.force:
         # https://github.com/bitcoin/bitcoin/commit/d52802551752140cf41f0d9a225a43e84404d3e9
@@ -13,6 +13,27 @@ from test_framework.util import assert_equal, start_node, DEFAULT_FEE
 
 from decimal import Decimal
 
+# Amounts paid by the spends of the block 1/2/3 coinbases, and by the
+# transactions spending those in turn.
+SPEND1_AMOUNTS = [ Decimal('3802400'), Decimal('97'), Decimal('97') ]
+SPEND2_AMOUNTS = [ Decimal('3802399.999') - DEFAULT_FEE, Decimal('97.0') - DEFAULT_FEE, Decimal('97.0') - DEFAULT_FEE ]
+
+
+def assert_mempool_state(node, expected_ids, tracked_ids):
+    """
+    Assert that the mempool holds exactly expected_ids using a single
+    getrawmempool call. Only on a mismatch are the tracked_ids looked up
+    individually, to report where each of them ended up.
+    """
+    mempool = frozenset(node.getrawmempool())
+    if mempool == expected_ids:
+        return
+    tracked_ids = sorted(tracked_ids)
+    txs = node.batch([ node.gettransaction.get_request(txid) for txid in tracked_ids ])
+    details = [ "%s: %s, %d confirmations" % (txid, "in mempool" if txid in mempool else "not in mempool", tx["confirmations"])
+                for txid, tx in zip(tracked_ids, txs) ]
+    raise AssertionError("Mempool has %d txns, expected %d:\n%s" % (len(mempool), len(expected_ids), "\n".join(details)))
+
 
 # Create one-input, one-output, no-fee transaction:
 class MempoolCoinbaseTest(BitcoinTestFramework):
@@ -29,16 +50,18 @@ class MempoolCoinbaseTest(BitcoinTestFramework):
         self.nodes.append(start_node(0, self.options.tmpdir, args))
         self.is_network_split = False
 
-    def create_tx(self, from_txid, to_address, amount):
-        inputs = [{ "txid" : from_txid, "vout" : 0}]
-        outputs = { to_address : amount }
-        rawtx = self.nodes[0].createrawtransaction(inputs, outputs)
-        signresult = self.nodes[0].signrawtransaction(rawtx)
-        assert_equal(signresult["complete"], True)
-        return signresult["hex"]
+    def create_txs(self, from_txids, to_address, amounts):
+        node = self.nodes[0]
+        rawtxs = node.batch([ node.createrawtransaction.get_request([{ "txid" : from_txid, "vout" : 0}], { to_address : amount })
+                              for from_txid, amount in zip(from_txids, amounts) ])
+        signresults = node.batch([ node.signrawtransaction.get_request(rawtx) for rawtx in rawtxs ])
+        for signresult in signresults:
+            assert_equal(signresult["complete"], True)
+        return [ signresult["hex"] for signresult in signresults ]
 
     def run_test(self):
-        node0_address = self.nodes[0].getnewaddress()
+        node = self.nodes[0]
+        node0_address = node.getnewaddress()
         # Spend block 1/2/3's coinbase transactions
         # Mine a block.
         # Create three more transactions, spending the spends
@@ -49,45 +72,52 @@ class MempoolCoinbaseTest(BitcoinTestFramework):
         # Mine a new block
         # ... make sure all the transactions are confirmed again.
 
-        b = [ self.nodes[0].getblockhash(n) for n in range(1, 4) ]
-        coinbase_txids = [ self.nodes[0].getblock(h)['tx'][0] for h in b ]
-        spends1_raw = [ self.create_tx(txid, node0_address, 3920000*0.97) if i == 0 else self.create_tx(txid, node0_address, 97) for i, txid in enumerate(coinbase_txids) ]
-        spends1_id = [ self.nodes[0].sendrawtransaction(tx) for tx in spends1_raw ]
+        b = node.batch([ node.getblockhash.get_request(n) for n in range(1, 4) ])
+        coinbase_txids = [ blk['tx'][0] for blk in node.batch([ node.getblock.get_request(h) for h in b ]) ]
+        spends1_raw = self.create_txs(coinbase_txids, node0_address, SPEND1_AMOUNTS)
+        spends1_id = node.batch([ node.sendrawtransaction.get_request(tx) for tx in spends1_raw ])
 
+        # The spends must be mined in two separate blocks, so that the
+        # re-org below resurrects transactions from more than one block;
+        # these generate calls cannot be merged.
         blocks = []
-        blocks.extend(self.nodes[0].generate(1))
+        blocks.extend(node.generate(1))
+
+        spends2_raw = self.create_txs(spends1_id, node0_address, SPEND2_AMOUNTS)
+        spends2_id = node.batch([ node.sendrawtransaction.get_request(tx) for tx in spends2_raw ])
 
-        spends2_raw = [ self.create_tx(txid, node0_address, Decimal('3802399.999') - DEFAULT_FEE) if i == 0 else self.create_tx(txid, node0_address, Decimal('97.0') - DEFAULT_FEE) for i, txid in enumerate(spends1_id) ]
-        spends2_id = [ self.nodes[0].sendrawtransaction(tx) for tx in spends2_raw ]
+        expected_ids = frozenset(spends1_id + spends2_id)
 
-        blocks.extend(self.nodes[0].generate(1))
+        blocks.extend(node.generate(1))
         self.sync_all()
 
+        # each round of spends was mined in its own block
+        (block1, block2) = node.batch([ node.getblock.get_request(h) for h in blocks ])
+        assert set(spends1_id) <= set(block1['tx'])
+        assert set(spends2_id) <= set(block2['tx'])
+
         # mempool should be empty, all txns confirmed
-        assert_equal(set(self.nodes[0].getrawmempool()), set())
-        for txid in spends1_id+spends2_id:
-            tx = self.nodes[0].gettransaction(txid)
+        assert_mempool_state(node, frozenset(), expected_ids)
+        for tx in node.batch([ node.gettransaction.get_request(txid) for txid in expected_ids ]):
             assert(tx["confirmations"] > 0)
 
         # Use invalidateblock to re-org back; all transactions should
         # end up unconfirmed and back in the mempool
-        for node in self.nodes:
-            node.invalidateblock(blocks[0])
+        for n in self.nodes:
+            n.invalidateblock(blocks[0])
 
-        # mempool should be empty, all txns confirmed
-        assert_equal(set(self.nodes[0].getrawmempool()), set(spends1_id+spends2_id))
-        for txid in spends1_id+spends2_id:
-            tx = self.nodes[0].gettransaction(txid)
-            assert(tx["confirmations"] == 0)
+        # all txns should be back in the mempool; anything in the mempool
+        # is unconfirmed, so there is no need to query each one
+        assert_mempool_state(node, expected_ids, expected_ids)
 
-        # Generate another block, they should all get mined
-        self.nodes[0].generate(1)
+        # Generate another block, they should all get mined in it
+        new_block = node.generate(1)[0]
         self.sync_all()
+        assert expected_ids <= set(node.getblock(new_block)['tx'])
 
         # mempool should be empty, all txns confirmed
-        assert_equal(set(self.nodes[0].getrawmempool()), set())
-        for txid in spends1_id+spends2_id:
-            tx = self.nodes[0].gettransaction(txid)
+        assert_mempool_state(node, frozenset(), expected_ids)
+        for tx in node.batch([ node.gettransaction.get_request(txid) for txid in expected_ids ]):
             assert(tx["confirmations"] > 0)
 
 
@@ -10,7 +10,8 @@
   - sends proper, incrementing 'id'
   - sends Basic HTTP authentication headers
   - parses all JSON numbers that look like floats as Decimal
-  - uses standard Python json lib
+  - uses simplejson, or orjson (if installed) for responses that
+    cannot contain floats
 
   Previous copyright, from python-jsonrpc/jsonrpc/proxy.py:
 
@@ -35,17 +36,48 @@
 
 import base64
 import decimal
+import itertools
 import simplejson as json
 import logging
-from http.client import HTTPConnection, HTTPSConnection, BadStatusLine
+from http.client import HTTPConnection, HTTPSConnection, BadStatusLine, RemoteDisconnected
 from urllib.parse import urlparse
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 USER_AGENT = "AuthServiceProxy/0.1"
 
 HTTP_TIMEOUT = 600
 
 log = logging.getLogger("BitcoinRPC")
 
+# Methods whose results never contain JSON floats, so that they can be
+# parsed by orjson (which has no parse_float=Decimal) without losing
+# precision. getrawmempool only qualifies in its non-verbose form.
+FAST_PARSE_METHODS = frozenset([
+    'createrawtransaction',
+    'generate',
+    'getbestblockhash',
+    'getblockcount',
+    'getblockhash',
+    'getnewaddress',
+    'getrawmempool',
+    'sendrawtransaction',
+    'signrawtransaction',
+])
+
+def _can_parse_fast(rpc_call_list):
+    if orjson is None:
+        return False
+    for request in rpc_call_list:
+        if request['method'] not in FAST_PARSE_METHODS:
+            return False
+        if request['method'] == 'getrawmempool' and any(request['params']):
+            return False
+    return True
+
 class JSONRPCException(Exception):
     def __init__(self, rpc_error):
         Exception.__init__(self, rpc_error.get("message"))
@@ -58,7 +90,9 @@ def EncodeDecimal(o):
 
 
 class AuthServiceProxy():
-    __id_count = 0
+    # next() on a count is atomic, so ids stay unique when nodes are
+    # called from several threads (see util.parallel_map)
+    __id_count = itertools.count(1)
 
     def __init__(self, service_url, service_name=None, timeout=HTTP_TIMEOUT, connection=None):
         self.__service_url = service_url
@@ -97,42 +131,46 @@ class AuthServiceProxy():
             name = "%s.%s" % (self._service_name, name)
         return AuthServiceProxy(self.__service_url, name, connection=self.__conn)
 
-    def _request(self, method, path, postdata):
+    def _request(self, method, path, postdata, fast_parse=False):
         '''
-        Do a HTTP request, with retry if we get disconnected (e.g. due to a timeout).
-        This is a workaround for https://bugs.python.org/issue3566 which is fixed in Python 3.5.
+        Do a HTTP request on the persistent connection, reconnecting once if the
+        server dropped it (e.g. due to an idle timeout).
         '''
         headers = {'Host': self.__url.hostname,
                    'User-Agent': USER_AGENT,
                    'Authorization': self.__auth_header,
-                   'Content-type': 'application/json'}
+                   'Content-type': 'application/json',
+                   'Connection': 'keep-alive'}
         try:
             self.__conn.request(method, path, postdata, headers)
-            return self._get_response()
+            return self._get_response(fast_parse)
         except Exception as e:
-            # If connection was closed, try again.
-            # Python 3.5+ raises BrokenPipeError instead of BadStatusLine when the connection was reset.
-            # ConnectionResetError happens on FreeBSD with Python 3.4.
-            # This can be simplified now that we depend on Python 3 (previously, we could not
-            # refer to BrokenPipeError or ConnectionResetError which did not exist on Python 2)
+            # If the server closed the kept-alive connection, reconnect and try again.
+            # Python 3.5+ raises RemoteDisconnected (a BadStatusLine and ConnectionResetError)
+            # if the server closed the connection before responding, and BrokenPipeError if
+            # the connection was reset while sending.
             if ((isinstance(e, BadStatusLine) and e.line == "''")
-                or e.__class__.__name__ in ('BrokenPipeError', 'ConnectionResetError')):
+                or isinstance(e, (RemoteDisconnected, BrokenPipeError, ConnectionResetError))):
                 self.__conn.close()
                 self.__conn.request(method, path, postdata, headers)
-                return self._get_response()
+                return self._get_response(fast_parse)
             else:
                 raise
 
-    def __call__(self, *args):
-        AuthServiceProxy.__id_count += 1
+    def get_request(self, *args):
+        request_id = next(AuthServiceProxy.__id_count)
 
-        log.debug("-%s-> %s %s"%(AuthServiceProxy.__id_count, self._service_name,
+        log.debug("-%s-> %s %s"%(request_id, self._service_name,
                                  json.dumps(args, default=EncodeDecimal)))
-        postdata = json.dumps({'version': '1.1',
-                               'method': self._service_name,
-                               'params': args,
-                               'id': AuthServiceProxy.__id_count}, default=EncodeDecimal)
-        response = self._request('POST', self.__url.path, postdata)
+        return {'version': '1.1',
+                'method': self._service_name,
+                'params': args,
+                'id': request_id}
+
+    def __call__(self, *args):
+        request = self.get_request(*args)
+        postdata = json.dumps(request, default=EncodeDecimal)
+        response = self._request('POST', self.__url.path, postdata, _can_parse_fast([request]))
         if response['error'] is not None:
             raise JSONRPCException(response['error'])
         elif 'result' not in response:
@@ -142,11 +180,36 @@ class AuthServiceProxy():
             return response['result']
 
     def _batch(self, rpc_call_list):
-        postdata = json.dumps(list(rpc_call_list), default=EncodeDecimal)
+        rpc_call_list = list(rpc_call_list)
+        postdata = json.dumps(rpc_call_list, default=EncodeDecimal)
         log.debug("--> "+postdata)
-        return self._request('POST', self.__url.path, postdata)
+        return self._request('POST', self.__url.path, postdata, _can_parse_fast(rpc_call_list))
 
-    def _get_response(self):
+    def batch(self, rpc_call_list):
+        '''
+        Send a list of requests built with get_request() as a single JSON-RPC
+        batch and return their results in the same order, raising
+        JSONRPCException for the first request that failed.
+        '''
+        rpc_call_list = list(rpc_call_list)
+        if not rpc_call_list:
+            return []
+        responses = dict((r['id'], r) for r in self._batch(rpc_call_list))
+        results = []
+        for request in rpc_call_list:
+            response = responses.get(request['id'])
+            if response is None:
+                raise JSONRPCException({
+                    'code': -343, 'message': 'missing JSON-RPC batch response'})
+            if response.get('error') is not None:
+                raise JSONRPCException(response['error'])
+            elif 'result' not in response:
+                raise JSONRPCException({
+                    'code': -343, 'message': 'missing JSON-RPC result'})
+            results.append(response['result'])
+        return results
+
+    def _get_response(self, fast_parse=False):
         http_response = self.__conn.getresponse()
         if http_response is None:
             raise JSONRPCException({
@@ -157,10 +220,13 @@ class AuthServiceProxy():
             raise JSONRPCException({
                 'code': -342, 'message': 'non-JSON HTTP response with \'%i %s\' from server' % (http_response.status, http_response.reason)})
 
-        responsedata = http_response.read().decode('utf8')
-        response = json.loads(responsedata, parse_float=decimal.Decimal)
+        responsedata = http_response.read()
+        if fast_parse:
+            response = orjson.loads(responsedata)
+        else:
+            response = json.loads(responsedata.decode('utf8'), parse_float=decimal.Decimal)
         if "error" in response and response["error"] is None:
             log.debug("<-%s- %s"%(response["id"], json.dumps(response["result"], default=EncodeDecimal)))
         else:
-            log.debug("<-- "+responsedata)
+            log.debug("<-- "+responsedata.decode('utf8'))
         return response
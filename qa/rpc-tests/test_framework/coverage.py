@@ -47,14 +47,36 @@ class AuthServiceProxyWrapper(object):
 
         """
         return_val = self.auth_service_proxy_instance.__call__(*args, **kwargs)
-        rpc_method = self.auth_service_proxy_instance._service_name
+        self._log_calls([self.auth_service_proxy_instance._service_name])
 
-        if self.coverage_logfile:
-            with open(self.coverage_logfile, 'a+', encoding='utf8') as f:
-                f.write("%s\n" % rpc_method)
+        return return_val
+
+    def get_request(self, *args):
+        """
+        Build a request for the wrapped RPC method without sending it, for
+        use with batch().
+
+        """
+        return self.auth_service_proxy_instance.get_request(*args)
+
+    def batch(self, rpc_call_list):
+        """
+        Delegates a list of requests to AuthServiceProxy.batch, then writes
+        each RPC method in the batch to a file.
+
+        """
+        rpc_call_list = list(rpc_call_list)
+        return_val = self.auth_service_proxy_instance.batch(rpc_call_list)
+        self._log_calls([request['method'] for request in rpc_call_list])
 
         return return_val
 
+    def _log_calls(self, rpc_methods):
+        if self.coverage_logfile:
+            with open(self.coverage_logfile, 'a+', encoding='utf8') as f:
+                for rpc_method in rpc_methods:
+                    f.write("%s\n" % rpc_method)
+
     @property
     def url(self):
         return self.auth_service_proxy_instance.url
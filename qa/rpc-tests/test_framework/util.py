@@ -23,6 +23,7 @@ import tempfile
 import time
 import re
 import errno
+from concurrent.futures import ThreadPoolExecutor
 
 from . import coverage
 from .authproxy import AuthServiceProxy, JSONRPCException
@@ -93,6 +94,43 @@ def p2p_port(n):
 def rpc_port(n):
     return PORT_MIN + PORT_RANGE + n + (MAX_NODES * PortSeed.n) % (PORT_RANGE - 1 - MAX_NODES)
 
+def zmq_port(n):
+    return PORT_MIN + 2 * PORT_RANGE + n + (MAX_NODES * PortSeed.n) % (PORT_RANGE - 1 - MAX_NODES)
+
+def zmq_hashblock_args(n):
+    return ['-zmqpubhashblock=tcp://127.0.0.1:%d' % zmq_port(n)]
+
+zmq_subscribers = []
+
+def zmq_hashblock_subscribers(num_nodes):
+    """
+    Subscribe to the hashblock notifications of nodes started with
+    zmq_hashblock_args(). Returns None unless kotod was built with ZMQ
+    (ENABLE_ZMQ=1, set by rpc-tests.py) and python3-zmq is installed.
+    The sockets are closed by stop_nodes().
+    """
+    if os.getenv("ENABLE_ZMQ", "") != "1":
+        return None
+    try:
+        import zmq
+    except ImportError:
+        return None
+    context = zmq.Context.instance()
+    subscribers = []
+    for i in range(num_nodes):
+        socket = context.socket(zmq.SUB)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.setsockopt(zmq.SUBSCRIBE, b"hashblock")
+        socket.connect("tcp://127.0.0.1:%d" % zmq_port(i))
+        subscribers.append(socket)
+    zmq_subscribers.extend(subscribers)
+    return subscribers
+
+def close_zmq_subscribers():
+    for socket in zmq_subscribers:
+        socket.close()
+    del zmq_subscribers[:]
+
 def check_json_precision():
     """Make sure json library being used does not lose precision converting BTC values"""
     n = Decimal("20000000.00000003")
@@ -138,6 +176,38 @@ def sync_blocks(rpc_connections, wait=0.125, timeout=60, allow_different_tips=Fa
 
     raise AssertionError("Block sync failed")
 
+def sync_blocks_zmq(rpc_connections, subscribers, wait=0.5, timeout=60):
+    """
+    Like sync_blocks, but rather than sleeping between checks of the
+    tips, wait until one of the ZMQ subscribers (from
+    zmq_hashblock_subscribers()) reports a new block, or for at most
+    wait seconds.
+
+    Falls back to sync_blocks if subscribers is None.
+    """
+    if subscribers is None:
+        return sync_blocks(rpc_connections, timeout=timeout)
+
+    import zmq
+    poller = zmq.Poller()
+    for socket in subscribers:
+        poller.register(socket, zmq.POLLIN)
+
+    while timeout > 0:
+        tips = [ x.getbestblockhash() for x in rpc_connections ]
+        if tips == [ tips[0] ]*len(tips):
+            break
+        start = time.time()
+        for (socket, _) in poller.poll(wait * 1000):
+            # Drain everything queued so far; only the wakeup matters.
+            while socket.poll(0):
+                socket.recv_multipart()
+        timeout -= time.time() - start
+
+    # The notifications only say that a tip changed, so use the
+    # polling version to confirm and wait for internal listeners.
+    return sync_blocks(rpc_connections, timeout=max(timeout, 0.125))
+
 def sync_mempools(rpc_connections, wait=0.5, timeout=60):
     """
     Wait until everybody has the same transactions in their memory
@@ -165,6 +235,19 @@ def sync_mempools(rpc_connections, wait=0.5, timeout=60):
 
     raise AssertionError("Mempool sync failed")
 
+def parallel_map(fn, nodes):
+    """
+    Apply fn to each of nodes concurrently, returning the results in order.
+
+    Each node has a single RPC connection, so every item must refer to a
+    different node.
+    """
+    nodes = list(nodes)
+    if not nodes:
+        return []
+    with ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+        return list(pool.map(fn, nodes))
+
 bitcoind_processes = {}
 
 def initialize_datadir(dirname, n):
@@ -430,6 +513,7 @@ def stop_nodes(nodes):
         except http.client.CannotSendRequest as e:
             print("WARN: Unable to stop node: " + repr(e))
     del nodes[:] # Emptying array closes connections as a side effect
+    close_zmq_subscribers()
 
 def set_node_times(nodes, t):
     for node in nodes:
@@ -9,10 +9,17 @@
 
 from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import assert_equal, connect_nodes, \
-    sync_blocks, gather_inputs
+    gather_inputs, parallel_map, start_nodes, sync_blocks_zmq, \
+    zmq_hashblock_args, zmq_hashblock_subscribers
 
 from decimal import Decimal
 
+MINING_REWARD = Decimal("97")
+STARTING_BALANCE = Decimal("3802400") + MINING_REWARD * 24
+STARTING_BALANCE2 = MINING_REWARD * 25
+CHANGE_AMOUNT = MINING_REWARD - 2
+SPEND_AMOUNT = STARTING_BALANCE - CHANGE_AMOUNT
+
 
 class TxnMallTest(BitcoinTestFramework):
 
@@ -25,32 +32,38 @@ class TxnMallTest(BitcoinTestFramework):
         parser.add_option("--mineblock", dest="mine_block", default=False, action="store_true",
                           help="Test double-spend of 1-confirmed transaction")
 
+    def setup_nodes(self):
+        # Wake up block syncs on hashblock notifications where possible
+        self.zmq_subscribers = zmq_hashblock_subscribers(self.num_nodes)
+        extra_args = None
+        if self.zmq_subscribers is not None:
+            extra_args = [ zmq_hashblock_args(i) for i in range(self.num_nodes) ]
+        return start_nodes(self.num_nodes, self.options.tmpdir, extra_args)
+
     def setup_network(self):
         # Start with split network:
-        return super(TxnMallTest, self).setup_network(True)
+        super(TxnMallTest, self).setup_network(True)
+        # bug workaround, coins generated assigned to first getnewaddress!
+        parallel_map(lambda node: node.getnewaddress(""), self.nodes)
 
     def run_test(self):
-        mining_reward = Decimal(100*0.97)
-        starting_balance = Decimal(3920000*0.97) + mining_reward * 24
-        starting_balance2 = mining_reward * 25
-
+        balances = parallel_map(lambda node: node.getbalance(), self.nodes)
         for i in range(4):
             if i == 0:
-                assert_equal(self.nodes[i].getbalance(), starting_balance)
+                assert_equal(balances[i], STARTING_BALANCE)
             else:
-                assert_equal(self.nodes[i].getbalance(), starting_balance2)
-            self.nodes[i].getnewaddress("")  # bug workaround, coins generated assigned to first getnewaddress!
+                assert_equal(balances[i], STARTING_BALANCE2)
 
         # Coins are sent to node1_address
         node1_address = self.nodes[1].getnewaddress("")
 
-        # First: use raw transaction API to send (starting_balance - (mining_reward - 2)) BTC to node1_address,
+        # First: use raw transaction API to send SPEND_AMOUNT BTC to node1_address,
         # but don't broadcast:
-        (total_in, inputs) = gather_inputs(self.nodes[0], (starting_balance - (mining_reward - 2)))
+        (total_in, inputs) = gather_inputs(self.nodes[0], SPEND_AMOUNT)
         change_address = self.nodes[0].getnewaddress("")
         outputs = {}
-        outputs[change_address] = (mining_reward - 2)
-        outputs[node1_address] = (starting_balance - (mining_reward - 2))
+        outputs[change_address] = CHANGE_AMOUNT
+        outputs[node1_address] = SPEND_AMOUNT
         rawtx = self.nodes[0].createrawtransaction(inputs, outputs)
         doublespend = self.nodes[0].signrawtransaction(rawtx)
         assert_equal(doublespend["complete"], True)
@@ -58,21 +71,20 @@ class TxnMallTest(BitcoinTestFramework):
         # Create two transaction from node[0] to node[1]; the
         # second must spend change from the first because the first
         # spends all mature inputs:
-        txid1 = self.nodes[0].sendtoaddress(node1_address, (starting_balance - (mining_reward - 2)))
+        txid1 = self.nodes[0].sendtoaddress(node1_address, SPEND_AMOUNT)
         txid2 = self.nodes[0].sendtoaddress(node1_address, 5)
 
         # Have node0 mine a block:
         if (self.options.mine_block):
             self.nodes[0].generate(1)
-            sync_blocks(self.nodes[0:2])
+            sync_blocks_zmq(self.nodes[0:2], self.zmq_subscribers)
 
-        tx1 = self.nodes[0].gettransaction(txid1)
-        tx2 = self.nodes[0].gettransaction(txid2)
+        (tx1, tx2) = self.nodes[0].batch([ self.nodes[0].gettransaction.get_request(txid) for txid in (txid1, txid2) ])
 
-        # Node0's balance should be starting balance, plus mining_reward for another
-        # matured block, minus (starting_balance - (mining_reward - 2)), minus 5, and minus transaction fees:
-        expected = Decimal(starting_balance)
-        if self.options.mine_block: expected += mining_reward
+        # Node0's balance should be starting balance, plus MINING_REWARD for another
+        # matured block, minus SPEND_AMOUNT, minus 5, and minus transaction fees:
+        expected = STARTING_BALANCE
+        if self.options.mine_block: expected += MINING_REWARD
         expected += tx1["amount"] + tx1["fee"]
         expected += tx2["amount"] + tx2["fee"]
         assert_equal(self.nodes[0].getbalance(), expected)
@@ -81,7 +93,7 @@ class TxnMallTest(BitcoinTestFramework):
             assert_equal(tx1["confirmations"], 1)
             assert_equal(tx2["confirmations"], 1)
             # Node1's total balance should be its starting balance plus both transaction amounts:
-            assert_equal(self.nodes[1].getbalance(""), starting_balance - (tx1["amount"]+tx2["amount"]))
+            assert_equal(self.nodes[1].getbalance(""), STARTING_BALANCE - (tx1["amount"]+tx2["amount"]))
         else:
             assert_equal(tx1["confirmations"], 0)
             assert_equal(tx2["confirmations"], 0)
@@ -94,24 +106,23 @@ class TxnMallTest(BitcoinTestFramework):
         # Reconnect the split network, and sync chain:
         connect_nodes(self.nodes[1], 2)
         self.nodes[2].generate(1)  # Mine another block to make sure we sync
-        sync_blocks(self.nodes)
+        sync_blocks_zmq(self.nodes, self.zmq_subscribers)
 
         # Re-fetch transaction info:
-        tx1 = self.nodes[0].gettransaction(txid1)
-        tx2 = self.nodes[0].gettransaction(txid2)
+        (tx1, tx2) = self.nodes[0].batch([ self.nodes[0].gettransaction.get_request(txid) for txid in (txid1, txid2) ])
 
         # Both transactions should be conflicted
         assert_equal(tx1["confirmations"], -1)
         assert_equal(tx2["confirmations"], -1)
 
-        # Node0's total balance should be starting balance, plus (mining_reward * 2) for
-        # two more matured blocks, minus (starting_balance - (mining_reward - 2)) for the double-spend:
-        expected = starting_balance + (mining_reward * 2) - (starting_balance - (mining_reward - 2))
+        # Node0's total balance should be starting balance, plus (MINING_REWARD * 2) for
+        # two more matured blocks, minus SPEND_AMOUNT for the double-spend:
+        expected = STARTING_BALANCE + (MINING_REWARD * 2) - SPEND_AMOUNT
         assert_equal(self.nodes[0].getbalance(), expected)
         assert_equal(self.nodes[0].getbalance("*"), expected)
 
         # Node1's total balance should be its starting balance plus the amount of the mutated send:
-        assert_equal(self.nodes[1].getbalance(""), starting_balance + (starting_balance2 - (mining_reward - 2)))
+        assert_equal(self.nodes[1].getbalance(""), STARTING_BALANCE + (STARTING_BALANCE2 - CHANGE_AMOUNT))
 
 if __name__ == '__main__':
     TxnMallTest().main()